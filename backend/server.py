@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 # On garde dotenv seulement si le fichier existe (pour ton ordi), sinon on ignore (pour Render)
 try:
     from dotenv import load_dotenv
@@ -12,12 +13,20 @@ except ImportError:
 
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+import anyio
 import os
+import time
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+import hashlib
+import orjson
 import uvicorn  # Il faudra peut-être ajouter 'uvicorn' à ton requirements.txt
 
 # --- MongoDB connection ---
@@ -28,18 +37,53 @@ if not mongo_url:
     # Valeur par défaut pour éviter le crash immédiat, mais ça ne marchera pas sans vraie URL
     mongo_url = "mongodb://localhost:27017"
 
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware : les Date BSON reviennent en datetime UTC aware, sans conversion côté route
+# maxPoolSize doit couvrir au moins les requêtes concurrentes attendues par worker,
+# sinon elles font la queue pour une connexion
+client = AsyncIOMotorClient(
+    mongo_url,
+    tz_aware=True,
+    maxPoolSize=int(os.environ.get("MONGO_MAX_POOL", 200)),
+    minPoolSize=20,
+    serverSelectionTimeoutMS=3000,
+)
 db_name = os.environ.get('DB_NAME', 'ufo_database') # Nom par défaut si non défini
 db = client[db_name]
 
+# --- Lifespan ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Ping au démarrage : la connexion Mongo est ouverte avant la première
+    # requête au lieu de payer le handshake TCP dans la latence du premier client
+    await client.admin.command("ping")
+    # Migration one-shot : les anciens documents stockaient created_at en string ISO,
+    # on les convertit en vraie Date BSON pour ne plus jamais re-parser côté Python
+    await db.menu_items.update_many(
+        {"created_at": {"$type": "string"}},
+        [{"$set": {"created_at": {"$toDate": "$created_at"}}}]
+    )
+    # Sans index, chaque lookup par id et chaque liste filtrée scanne toute la collection
+    await db.menu_items.create_index("id", unique=True)
+    await db.menu_items.create_index([("category", 1), ("is_available", 1)])
+    # Le pool AnyIO (40 tokens par défaut) sert les dépendances/endpoints sync ;
+    # sous forte concurrence il devient un goulot d'étranglement
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 100
+    _log_listener.start()
+    logger.info("Mongo prêt (db=%s), indexes en place", db_name)
+    yield
+    client.close()
+    _log_listener.stop()
+
 # --- Main App ---
-app = FastAPI()
+# orjson sérialise dict/datetime nativement, bien plus vite que json.dumps
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # --- Models (inchangés) ---
 class MenuItem(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    # .hex : 32 caractères sans tirets, index plus compact et formatage plus rapide
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     name: str
     description: str
     price: float
@@ -67,59 +111,148 @@ class MenuItemUpdate(BaseModel):
     image_url: Optional[str] = None
     is_available: Optional[bool] = None
 
+class MenuItemBulkUpdate(MenuItemUpdate):
+    id: str
+
+# --- Cache du menu ---
+# Le menu ne change que via l'admin mais /menu est appelé à chaque chargement de
+# page : on cache le JSON déjà encodé (bytes) et on l'invalide à chaque écriture.
+# Le cache est par process : avec plusieurs workers, une écriture passée par un
+# autre worker n'invalide pas celui-ci, d'où le TTL court qui borne ce décalage
+_MENU_CACHE_TTL = float(os.environ.get("MENU_CACHE_TTL", 5))
+_menu_cache = {"etag": None, "body": None, "version": 0, "ts": 0.0}
+
+def _invalidate_menu_cache():
+    _menu_cache["version"] += 1
+    _menu_cache["etag"] = None
+    _menu_cache["body"] = None
+
 # --- Routes (inchangées) ---
-@api_router.get("/menu", response_model=List[MenuItem])
-async def get_menu_items():
-    items = await db.menu_items.find({}, {"_id": 0}).to_list(1000)
-    for item in items:
-        if isinstance(item.get('created_at'), str):
-            item['created_at'] = datetime.fromisoformat(item['created_at'])
-    return items
+# responses= garde le schéma OpenAPI sans payer la revalidation Pydantic des
+# documents qui sortent de Mongo (ils ont déjà été validés à l'insertion)
+@api_router.get("/menu", responses={200: {"model": List[MenuItem]}})
+async def get_menu_items(request: Request, category: Optional[str] = None,
+                         available: Optional[bool] = None, ids: Optional[str] = None):
+    if category is not None or available is not None or ids is not None:
+        # Requête filtrée : pas de cache, on interroge les index
+        query = {}
+        if category is not None:
+            query["category"] = category
+        if available is not None:
+            query["is_available"] = available
+        if ids is not None:
+            # ?ids=a,b,c : un seul $in au lieu de N appels GET /menu/{id}
+            query["id"] = {"$in": [i for i in ids.split(",") if i]}
+        # batch_size : le driver décode par paquets de 100 pendant que le réseau continue,
+        # au lieu de bufferiser les 1000 documents d'un coup
+        cursor = db.menu_items.find(query, {"_id": 0}).limit(1000).batch_size(100)
+
+        # Le tableau JSON est émis document par document : la mémoire de pointe
+        # reste O(batch_size) au lieu de O(résultat complet)
+        async def stream_items():
+            yield b"["
+            first = True
+            async for item in cursor:
+                if first:
+                    first = False
+                else:
+                    yield b","
+                yield orjson.dumps(item)
+            yield b"]"
+
+        return StreamingResponse(stream_items(), media_type="application/json")
 
-@api_router.get("/menu/{item_id}", response_model=MenuItem)
+    now = time.monotonic()
+    if _menu_cache["etag"] is None or now - _menu_cache["ts"] > _MENU_CACHE_TTL:
+        # On note la version avant la requête : si une écriture invalide le cache
+        # pendant que le curseur draine, on ne doit pas écraser son invalidation
+        version = _menu_cache["version"]
+        cursor = db.menu_items.find({}, {"_id": 0}).limit(1000).batch_size(100)
+        body = orjson.dumps([item async for item in cursor])
+        # RFC 9110 : un entity-tag est une chaîne entre guillemets, sinon les
+        # intermédiaires conformes (CDN, reverse proxy) peuvent jeter le header
+        etag = '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+        if _menu_cache["version"] != version:
+            # Lecture concurrente d'une écriture : on répond avec ce qu'on vient
+            # de lire mais sans le mettre en cache (il est peut-être déjà périmé)
+            return Response(content=body, media_type="application/json",
+                            headers={"ETag": etag})
+        _menu_cache["etag"] = etag
+        _menu_cache["body"] = body
+        _menu_cache["ts"] = now
+    etag = _menu_cache["etag"]
+    if request.headers.get("if-none-match") == etag:
+        # Le client a déjà la bonne version : zéro Mongo, zéro sérialisation
+        return Response(status_code=304, headers={"ETag": etag})
+    # Les bytes sont déjà encodés : la réponse est un simple memcpy
+    return Response(content=_menu_cache["body"], media_type="application/json",
+                    headers={"ETag": etag})
+
+@api_router.get("/menu/{item_id}", responses={200: {"model": MenuItem}})
 async def get_menu_item(item_id: str):
     item = await db.menu_items.find_one({"id": item_id}, {"_id": 0})
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    if isinstance(item.get('created_at'), str):
-        item['created_at'] = datetime.fromisoformat(item['created_at'])
-    return item
+    return MenuItem.model_construct(**item)
 
-@api_router.post("/menu", response_model=MenuItem)
+@api_router.post("/menu", responses={200: {"model": MenuItem}})
 async def create_menu_item(item_input: MenuItemCreate):
     item_dict = item_input.model_dump()
-    menu_item = MenuItem(**item_dict)
+    # L'input vient d'être validé par MenuItemCreate, inutile de revalider
+    menu_item = MenuItem.model_construct(**item_dict)
     doc = menu_item.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.menu_items.insert_one(doc)
+    _invalidate_menu_cache()
     return menu_item
 
-@api_router.put("/menu/{item_id}", response_model=MenuItem)
+@api_router.put("/menu/{item_id}", responses={200: {"model": MenuItem}})
 async def update_menu_item(item_id: str, item_update: MenuItemUpdate):
-    existing_item = await db.menu_items.find_one({"id": item_id}, {"_id": 0})
-    if not existing_item:
-        raise HTTPException(status_code=404, detail="Item not found")
     update_data = item_update.model_dump(exclude_unset=True)
-    if update_data:
-        await db.menu_items.update_one({"id": item_id}, {"$set": update_data})
-    updated_item = await db.menu_items.find_one({"id": item_id}, {"_id": 0})
-    if isinstance(updated_item.get('created_at'), str):
-        updated_item['created_at'] = datetime.fromisoformat(updated_item['created_at'])
-    return updated_item
+    if not update_data:
+        # Rien à modifier : un simple find_one suffit
+        updated_item = await db.menu_items.find_one({"id": item_id}, {"_id": 0})
+    else:
+        # Un seul aller-retour Mongo (atomique) au lieu de find_one + update_one + find_one
+        updated_item = await db.menu_items.find_one_and_update(
+            {"id": item_id},
+            {"$set": update_data},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+    if updated_item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    _invalidate_menu_cache()
+    return MenuItem.model_construct(**updated_item)
+
+@api_router.put("/menu")
+async def bulk_update_menu_items(items: List[MenuItemBulkUpdate]):
+    # Un seul bulk_write (un aller-retour) au lieu de N PUT unitaires
+    ops = []
+    for item in items:
+        update_data = item.model_dump(exclude_unset=True, exclude={"id"})
+        if update_data:
+            ops.append(UpdateOne({"id": item.id}, {"$set": update_data}))
+    if not ops:
+        return {"matched": 0, "modified": 0}
+    result = await db.menu_items.bulk_write(ops, ordered=False)
+    _invalidate_menu_cache()
+    return {"matched": result.matched_count, "modified": result.modified_count}
 
 @api_router.delete("/menu/{item_id}")
 async def delete_menu_item(item_id: str):
     result = await db.menu_items.delete_one({"id": item_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
+    _invalidate_menu_cache()
     return {"message": "Item deleted successfully"}
 
 @api_router.post("/menu/seed")
 async def seed_menu():
-    await db.menu_items.delete_many({})
+    # Un seul timestamp pour tout le batch
+    now = datetime.now(timezone.utc)
     initial_items = [
         {
-            "id": str(uuid.uuid4()),
+            "id": uuid.uuid4().hex,
             "name": "Original Beef Bulgogi",
             "description": "Émincé de bœuf bulgogi, oignons rouges, poivrons, cheddar, salade, sauce secrète.",
             "price": 13.90,
@@ -127,11 +260,16 @@ async def seed_menu():
             "tag": "Signature",
             "image_url": "https://images.pexels.com/photos/5836779/pexels-photo-5836779.jpeg",
             "is_available": True,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": now
         },
         # ... (J'ai raccourci pour la lisibilité, tu peux garder ta liste complète) ...
     ]
-    await db.menu_items.insert_many(initial_items)
+    # Même session pour le delete + insert, et ordered=False pour laisser Mongo
+    # paralléliser le batch côté serveur
+    async with await client.start_session() as session:
+        await db.menu_items.delete_many({}, session=session)
+        await db.menu_items.insert_many(initial_items, ordered=False, session=session)
+    _invalidate_menu_cache()
     return {"message": f"Seeded menu items successfully"}
 
 @api_router.get("/")
@@ -142,29 +280,41 @@ app.include_router(api_router)
 
 # --- CORS ---
 # Important: Autoriser tout le monde en dev, ou spécifier le frontend en prod
-origins = os.environ.get('CORS_ORIGINS', '*').split(',')
+origins = tuple(o.strip() for o in os.environ.get('CORS_ORIGINS', '*').split(',') if o.strip())
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
+    allow_origins=list(origins),
+    # Le spec CORS interdit credentials avec le wildcard : les navigateurs
+    # rejettent la combinaison et re-tentent le preflight pour rien
+    allow_credentials=origins != ("*",),
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# --- Logging & Shutdown ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Logging ---
+# Le formatage et l'I/O passent par un QueueListener sur son propre thread :
+# l'event loop ne bloque jamais sur un write() de log
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(
+    logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, _log_stream_handler, respect_handler_level=True)
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(_log_queue)])
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
-
 # --- DEMARRAGE DU SERVEUR (TRES IMPORTANT POUR RENDER) ---
 if __name__ == "__main__":
     # Render donne le port via la variable d'environnement PORT
     # Si elle n'existe pas (sur ton PC), on utilise 5000
     port = int(os.environ.get("PORT", 5000))
+
+    # Un worker par défaut laisse les autres cœurs inutilisés ; Render fournit
+    # WEB_CONCURRENCY, sinon on prend la règle classique 2*cœurs+1
+    workers = int(os.environ.get("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
     
     # On lance uvicorn
     # host="0.0.0.0" est OBLIGATOIRE sur Render
-    uvicorn.run("server:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
+    # uvloop + httptools (uvicorn[standard]) : nettement plus de req/s que la
+    # boucle asyncio et le parseur HTTP par défaut
+    uvicorn.run("server:app", host="0.0.0.0", port=port, reload=False,
+                loop="uvloop", http="httptools", workers=workers)
\ No newline at end of file